@@ -6,12 +6,35 @@ A chatbot that bridges LM Studio LLM with MCP servers via stdio/stdin
 
 import argparse
 import asyncio
+import io
 import json
 import logging
+import os
+import stat
 import sys
-from dataclasses import dataclass
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+
+# Prefer orjson, then ujson, then the stdlib encoder; all three produce UTF-8 bytes
+try:
+    import orjson
+
+    _DUMPS = orjson.dumps
+    _LOADS = orjson.loads
+    _DUMPS_INDENT = lambda obj: orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    try:
+        import ujson
+
+        _DUMPS = lambda obj: ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode()
+        _LOADS = ujson.loads
+        _DUMPS_INDENT = lambda obj: ujson.dumps(obj, indent=2, ensure_ascii=False,
+                                                escape_forward_slashes=False).encode()
+    except ImportError:
+        _DUMPS = lambda obj: json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+        _LOADS = json.loads
+        _DUMPS_INDENT = lambda obj: json.dumps(obj, indent=2, ensure_ascii=False).encode()
 
 # Configure logging
 logging.basicConfig(
@@ -48,6 +71,73 @@ class Colors:
     BRIGHT_CYAN = '\033[96m'
     BRIGHT_WHITE = '\033[97m'
 
+# Pre-encoded color codes for the JSON syntax highlighter
+_JSON_KEY_COLOR = Colors.BRIGHT_BLUE.encode()
+_JSON_STR_COLOR = Colors.BRIGHT_WHITE.encode()
+_JSON_NUM_COLOR = Colors.BRIGHT_MAGENTA.encode()
+_JSON_BOOL_COLOR = Colors.BRIGHT_CYAN.encode()
+_JSON_RESET = Colors.RESET.encode()
+
+def _colorize_json(obj: Any, indent: int = 2, prefix: str = "") -> str:
+    """Pretty-print JSON data with syntax colors in a single pass over the object"""
+    buf = bytearray()
+    line_prefix = prefix.encode()
+
+    def write_string(value: str, color: bytes):
+        # Escape via the JSON encoder, then put the color inside the quotes
+        encoded = _DUMPS(value)
+        buf.extend(b'"' + color + encoded[1:-1] + _JSON_RESET + b'"')
+
+    def write_value(value: Any, depth: int):
+        if isinstance(value, dict):
+            if not value:
+                buf.extend(b'{}')
+                return
+            inner = b'\n' + line_prefix + b' ' * (indent * (depth + 1))
+            buf.extend(b'{')
+            first = True
+            for key, item in value.items():
+                if not first:
+                    buf.extend(b',')
+                first = False
+                buf.extend(inner)
+                write_string(key if isinstance(key, str) else str(key), _JSON_KEY_COLOR)
+                buf.extend(b': ')
+                write_value(item, depth + 1)
+            buf.extend(b'\n' + line_prefix + b' ' * (indent * depth) + b'}')
+        elif isinstance(value, (list, tuple)):
+            if not value:
+                buf.extend(b'[]')
+                return
+            inner = b'\n' + line_prefix + b' ' * (indent * (depth + 1))
+            buf.extend(b'[')
+            first = True
+            for item in value:
+                if not first:
+                    buf.extend(b',')
+                first = False
+                buf.extend(inner)
+                write_value(item, depth + 1)
+            buf.extend(b'\n' + line_prefix + b' ' * (indent * depth) + b']')
+        elif isinstance(value, str):
+            write_string(value, _JSON_STR_COLOR)
+        elif value is None:
+            buf.extend(b'null')
+        elif isinstance(value, bool):
+            buf.extend(_JSON_BOOL_COLOR + (b'true' if value else b'false') + _JSON_RESET)
+        elif isinstance(value, (int, float)):
+            buf.extend(_JSON_NUM_COLOR + _DUMPS(value) + _JSON_RESET)
+        else:
+            buf.extend(_DUMPS(value))
+
+    buf.extend(line_prefix)
+    write_value(obj, 0)
+    return bytes(buf).decode()
+
+def _fast_hms(ts: datetime) -> str:
+    """Format a timestamp as HH:MM:SS without going through strftime"""
+    return f"{ts.hour:02d}:{ts.minute:02d}:{ts.second:02d}"
+
 # Icons for different types of messages
 class Icons:
     USER = "👤"
@@ -65,22 +155,25 @@ class OutputFormatter:
 
     def __init__(self, use_colors: bool = True):
         self.use_colors = use_colors
+        # Pick the implementation once instead of checking use_colors on every call
+        if use_colors:
+            self.colorize = self._colorize_impl
+        else:
+            self.colorize = lambda text, color: text
 
-    def colorize(self, text: str, color: str) -> str:
-        """Apply color to text if colors are enabled"""
-        if not self.use_colors:
-            return text
+    def _colorize_impl(self, text: str, color: str) -> str:
+        """Apply color to text"""
         return f"{color}{text}{Colors.RESET}"
 
     def format_user_prompt(self, message: str) -> str:
         """Format user input prompt"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        timestamp = _fast_hms(datetime.now())
         prompt = f"{Icons.USER} {self.colorize('You', Colors.BRIGHT_CYAN)} {self.colorize(f'[{timestamp}]', Colors.DIM)}: "
         return prompt
 
     def format_assistant_prompt(self) -> str:
         """Format assistant response prompt"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        timestamp = _fast_hms(datetime.now())
         prompt = f"{Icons.ASSISTANT} {self.colorize('Assistant', Colors.BRIGHT_GREEN)} {self.colorize(f'[{timestamp}]', Colors.DIM)}: "
         return prompt
 
@@ -105,29 +198,11 @@ class OutputFormatter:
         if not isinstance(data, (dict, list)):
             return str(data)
 
+        if self.use_colors:
+            return _colorize_json(data, indent=indent, prefix=prefix)
+
         json_str = json.dumps(data, indent=indent, ensure_ascii=False)
-        lines = json_str.split('\n')
-
-        formatted_lines = []
-        for line in lines:
-            if line.strip():
-                # Color JSON syntax
-                colored_line = line
-                if self.use_colors:
-                    # Color strings (values in quotes)
-                    import re
-                    colored_line = re.sub(r'"([^"]*)":', f'"{Colors.BRIGHT_BLUE}\\1{Colors.RESET}":', colored_line)
-                    colored_line = re.sub(r': "([^"]*)"', f': "{Colors.BRIGHT_WHITE}\\1{Colors.RESET}"', colored_line)
-                    # Color numbers
-                    colored_line = re.sub(r': (\d+)', f': {Colors.BRIGHT_MAGENTA}\\1{Colors.RESET}', colored_line)
-                    # Color booleans
-                    colored_line = re.sub(r': (true|false)', f': {Colors.BRIGHT_CYAN}\\1{Colors.RESET}', colored_line)
-
-                formatted_lines.append(prefix + colored_line)
-            else:
-                formatted_lines.append("")
-
-        return '\n'.join(formatted_lines)
+        return '\n'.join(prefix + line for line in json_str.split('\n'))
 
     def format_status_message(self, message: str, status: str = "info") -> str:
         """Format status messages"""
@@ -177,15 +252,11 @@ class OutputFormatter:
         }
         return result
 
-@dataclass
-class MCPMessage:
-    """Represents an MCP protocol message"""
-    jsonrpc: str = "2.0"
-    id: Optional[str] = None
-    method: Optional[str] = None
-    params: Optional[Dict] = None
-    result: Optional[Any] = None
-    error: Optional[Dict] = None
+# Static MCP messages, pre-serialized with a slot for the request id
+_INIT_TEMPLATE = (b'{"jsonrpc":"2.0","id":"%d","method":"initialize","params":{"protocolVersion":"2024-11-05",'
+                  b'"capabilities":{"tools":{}},"clientInfo":{"name":"mcp-chatbot","version":"1.0.0"}}}')
+_INITIALIZED_NOTIF = b'{"jsonrpc":"2.0","method":"notifications/initialized","params":{}}'
+_TOOLS_LIST_TEMPLATE = b'{"jsonrpc":"2.0","id":"%d","method":"tools/list","params":{}}'
 
 class MCPClient:
     """Client for communicating with MCP servers via subprocess"""
@@ -194,6 +265,9 @@ class MCPClient:
         self.server_command = server_command
         self.process = None
         self.message_id = 0
+        # Requests awaiting a response, keyed by JSON-RPC id
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._reader_task = None
 
     async def start(self):
         """Start the MCP server process"""
@@ -205,6 +279,7 @@ class MCPClient:
                 stderr=asyncio.subprocess.PIPE
             )
             logger.info(f"Started MCP server: {' '.join(self.server_command)}")
+            self._reader_task = asyncio.create_task(self._read_loop())
 
             # Initialize the connection
             await self.initialize()
@@ -216,137 +291,131 @@ class MCPClient:
     async def initialize(self):
         """Initialize MCP connection"""
         # Send initialize request
-        init_request = MCPMessage(
-            id=str(self.message_id),
-            method="initialize",
-            params={
-                "protocolVersion": "2024-11-05",
-                "capabilities": {
-                    "tools": {}
-                },
-                "clientInfo": {
-                    "name": "mcp-chatbot",
-                    "version": "1.0.0"
-                }
-            }
-        )
-
-        response = await self.send_request(init_request)
-        if response and not response.error:
+        self.message_id += 1
+        response = await self._exchange(str(self.message_id), _INIT_TEMPLATE % self.message_id)
+        if response and not response.get("error"):
             logger.info("MCP server initialized successfully")
 
             # Try to send initialized notification, but don't fail if not supported
             try:
-                initialized_notification = MCPMessage(
-                    method="notifications/initialized",
-                    params={}
-                )
-                await self.send_notification(initialized_notification)
+                await self._write_message(_INITIALIZED_NOTIF)
                 logger.info("Sent initialized notification")
             except Exception as e:
                 logger.warning(f"Could not send initialized notification (this may be normal): {e}")
         else:
-            raise Exception(f"Failed to initialize MCP server: {response.error if response else 'No response'}")
+            raise Exception(f"Failed to initialize MCP server: {response.get('error') if response else 'No response'}")
 
-    async def send_request(self, message: MCPMessage) -> Optional[MCPMessage]:
+    async def send_request(self, method: str, params: Dict) -> Optional[Dict]:
         """Send a request and wait for response"""
+        self.message_id += 1
+        request_id = str(self.message_id)
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+        return await self._exchange(request_id, _DUMPS(message))
+
+    async def _exchange(self, request_id: str, payload: bytes) -> Optional[Dict]:
+        """Write an encoded request and wait for the response with the same id"""
         if not self.process:
             raise Exception("MCP server not started")
 
-        self.message_id += 1
-        if message.id is None:
-            message.id = str(self.message_id)
+        # Nothing will answer once the reader has stopped
+        if self._reader_task is None or self._reader_task.done():
+            logger.error("MCP server connection is closed")
+            return None
 
-        # Send message
-        message_dict = {k: v for k, v in message.__dict__.items() if v is not None}
-        message_json = json.dumps(message_dict)
-        logger.debug(f"Sending: {message_json}")
+        logger.debug("Sending: %s", payload)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            await self._write_message(payload)
 
-        self.process.stdin.write((message_json + '\n').encode())
-        await self.process.stdin.drain()
+            # Wait for the reader task to deliver the matching response
+            try:
+                response_data = await asyncio.wait_for(future, timeout=10.0)
+            except asyncio.TimeoutError:
+                logger.error("Timeout waiting for MCP server response")
+                return None
+        finally:
+            self._pending.pop(request_id, None)
 
-        # Read response with timeout
-        try:
-            response_line = await asyncio.wait_for(
-                self.process.stdout.readline(),
-                timeout=10.0
-            )
-            if response_line:
-                response_text = response_line.decode().strip()
-                logger.debug(f"Raw response: {response_text}")
-
-                if response_text:
-                    try:
-                        response_data = json.loads(response_text)
-                        response = MCPMessage(
-                            jsonrpc=response_data.get("jsonrpc", "2.0"),
-                            id=response_data.get("id"),
-                            method=response_data.get("method"),
-                            params=response_data.get("params"),
-                            result=response_data.get("result"),
-                            error=response_data.get("error")
-                        )
-                        logger.debug(f"Parsed response: {response.__dict__}")
-                        return response
-                    except json.JSONDecodeError as e:
-                        logger.error(f"Failed to parse response JSON: {e}")
-                        logger.error(f"Raw response was: {response_text}")
-                        return None
-        except asyncio.TimeoutError:
-            logger.error("Timeout waiting for MCP server response")
-            return None
+        logger.debug("Parsed response: %s", response_data)
+        return response_data
 
-        return None
+    async def _write_message(self, payload: bytes):
+        """Write one encoded message to the server"""
+        # Two writes into the same pipe buffer avoid copying the payload
+        self.process.stdin.write(payload)
+        self.process.stdin.write(b'\n')
+        await self.process.stdin.drain()
 
-    async def send_notification(self, message: MCPMessage):
-        """Send a notification (no response expected)"""
-        if not self.process:
-            raise Exception("MCP server not started")
+    async def _read_loop(self):
+        """Read messages from the server and resolve the matching pending requests"""
+        try:
+            while True:
+                try:
+                    response_line = await self.process.stdout.readline()
+                except Exception as e:
+                    logger.error(f"MCP reader stopped: {e}")
+                    break
+                if not response_line:  # EOF
+                    break
 
-        message_dict = {k: v for k, v in message.__dict__.items() if v is not None}
-        message_json = json.dumps(message_dict)
-        logger.debug(f"Sending notification: {message_json}")
+                # Parse the raw line bytes directly; the decoder tolerates the trailing newline,
+                # and isspace() skips blank lines without copying the buffer like strip() would
+                if response_line.isspace():
+                    continue
+                logger.debug("Raw response: %s", response_line)
+                try:
+                    response_data = _LOADS(response_line)
+                except ValueError as e:
+                    logger.error(f"Failed to parse response JSON: {e}")
+                    logger.error(f"Raw response was: {response_line}")
+                    continue
 
-        self.process.stdin.write((message_json + '\n').encode())
-        await self.process.stdin.drain()
+                # Only JSON-RPC objects carrying one of our string ids can answer a request
+                message_id = response_data.get("id") if isinstance(response_data, dict) else None
+                future = self._pending.pop(message_id, None) if isinstance(message_id, str) else None
+                if future is None:
+                    logger.debug("Ignoring unsolicited message: %s", response_data)
+                elif not future.done():
+                    future.set_result(response_data)
+        finally:
+            # The server is gone, release anyone still waiting
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_result(None)
+            self._pending.clear()
 
     async def list_tools(self) -> List[Dict]:
         """List available tools from MCP server"""
-        request = MCPMessage(
-            method="tools/list",
-            params={}
-        )
-
-        response = await self.send_request(request)
-        if response and not response.error:
-            tools = response.result.get('tools', []) if response.result else []
+        self.message_id += 1
+        response = await self._exchange(str(self.message_id), _TOOLS_LIST_TEMPLATE % self.message_id)
+        if response and not response.get("error"):
+            result = response.get("result")
+            tools = result.get('tools', []) if result else []
             logger.info(f"Successfully retrieved {len(tools)} tools from MCP server")
             return tools
         else:
-            logger.error(f"Failed to list tools: {response.error if response else 'No response'}")
-            logger.error(f"Full response: {response.__dict__ if response else 'None'}")
+            logger.error(f"Failed to list tools: {response.get('error') if response else 'No response'}")
+            logger.error(f"Full response: {response}")
             return []
 
     async def call_tool(self, tool_name: str, arguments: Dict) -> Dict:
         """Call a tool on the MCP server"""
-        request = MCPMessage(
-            method="tools/call",
-            params={
-                "name": tool_name,
-                "arguments": arguments
-            }
-        )
-
-        response = await self.send_request(request)
-        if response and not response.error:
-            return response.result
+        response = await self.send_request("tools/call", {
+            "name": tool_name,
+            "arguments": arguments
+        })
+        if response and not response.get("error"):
+            return response.get("result")
         else:
-            error_msg = response.error if response else 'No response'
+            error_msg = response.get("error") if response else 'No response'
             logger.error(f"Failed to call tool {tool_name}: {error_msg}")
             return {"error": str(error_msg)}
 
     async def stop(self):
         """Stop the MCP server process"""
+        if self._reader_task:
+            self._reader_task.cancel()
         if self.process:
             self.process.terminate()
             await self.process.wait()
@@ -355,14 +424,25 @@ class MCPClient:
 class LMStudioClient:
     """Client for communicating with LM Studio via HTTP API"""
 
-    def __init__(self, base_url: str = "http://localhost:1234"):
+    def __init__(self, base_url: str = "http://localhost:1234", timeout: float = 300.0):
         self.base_url = base_url
+        self.timeout = timeout
         self.conversation_history = []
+        self._session = None
+
+    async def _get_session(self):
+        """Return the shared HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=8, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
 
     async def chat_completion(self, messages: List[Dict], tools: List[Dict] = None) -> Dict:
         """Send chat completion request to LM Studio"""
-        import aiohttp
-
         payload = {
             "model": "local-model",  # LM Studio uses this for local models
             "messages": messages,
@@ -375,32 +455,48 @@ class LMStudioClient:
             payload["tool_choice"] = "auto"
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                        f"{self.base_url}/v1/chat/completions",
-                        json=payload,
-                        headers={"Content-Type": "application/json"}
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"LM Studio API error: {response.status} - {error_text}")
-                        return {"error": f"API error: {response.status}"}
+            session = await self._get_session()
+            async with session.post(
+                    f"{self.base_url}/v1/chat/completions",
+                    json=payload,
+                    headers={"Content-Type": "application/json"}
+            ) as response:
+                if response.status == 200:
+                    return _LOADS(await response.read())
+                else:
+                    error_text = await response.text()
+                    logger.error(f"LM Studio API error: {response.status} - {error_text}")
+                    return {"error": f"API error: {response.status}"}
         except Exception as e:
             logger.error(f"Failed to connect to LM Studio: {e}")
             return {"error": f"Connection failed: {e}"}
 
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+# Longest stdin line accepted in stdio mode
+STDIN_LINE_LIMIT = 64 * 1024 * 1024
+
 class MCPChatBot:
     """Main chatbot class that orchestrates MCP and LM Studio"""
 
-    def __init__(self, mcp_server_command: List[str], lm_studio_url: str = "http://localhost:1234", use_colors: bool = True):
+    def __init__(self, mcp_server_command: List[str], lm_studio_url: str = "http://localhost:1234", use_colors: bool = True,
+                 history_window: int = 20, lm_timeout: float = 300.0):
         self.mcp_client = MCPClient(mcp_server_command)
-        self.lm_studio = LMStudioClient(lm_studio_url)
+        self.lm_studio = LMStudioClient(lm_studio_url, timeout=lm_timeout)
         self.available_tools = []
-        self.conversation_history = []
+        self._openai_tools = []
+        self._tool_names = []
+        self._tool_names_joined = "None"
+        # System message is pinned; only the most recent turns are kept, each as the list of
+        # messages it added, so trimming never separates a question from its answer
+        self._system_content = ""
+        self._system_msg = None
+        self._recent = deque(maxlen=history_window)
         self.formatter = OutputFormatter(use_colors)
-        self.tools_used_in_conversation = []
 
     async def start(self):
         """Start the chatbot"""
@@ -411,7 +507,11 @@ class MCPChatBot:
 
         # Get available tools
         self.available_tools = await self.mcp_client.list_tools()
-        logger.info(f"Available tools: {[tool['name'] for tool in self.available_tools]}")
+        # Tools don't change after startup, so convert them once
+        self._openai_tools = self.convert_tools_for_openai()
+        self._tool_names = [tool['name'] for tool in self.available_tools]
+        self._tool_names_joined = ', '.join(self._tool_names) or 'None'
+        logger.info(f"Available tools: {self._tool_names}")
 
         if not self.available_tools:
             logger.warning("No tools available from MCP server!")
@@ -427,38 +527,52 @@ class MCPChatBot:
                 except asyncio.TimeoutError:
                     pass
 
-        # Add system message with tool information
-        system_message = self.create_system_message()
-        self.conversation_history.append(system_message)
+        # Build the system message with tool information once
+        self._system_msg = self.create_system_message()
 
         logger.info("MCP Chatbot started successfully!")
 
     def create_system_message(self) -> Dict:
         """Create system message with tool descriptions"""
-        tool_descriptions = []
-        for tool in self.available_tools:
-            desc = f"- {tool['name']}: {tool.get('description', 'No description available')}"
+        buf = io.StringIO()
+        buf.write("""You are an AI assistant with access to MCP (Model Context Protocol) tools. 
+You can use these tools to help answer q`uestions and perform tasks.
+
+Available tools:
+""")
+        for i, tool in enumerate(self.available_tools):
+            if i:
+                buf.write("\n")
+            buf.write("- ")
+            buf.write(tool['name'])
+            buf.write(": ")
+            buf.write(tool.get('description', 'No description available'))
             if 'inputSchema' in tool:
                 properties = tool['inputSchema'].get('properties', {})
                 if properties:
-                    params = ", ".join(properties.keys())
-                    desc += f" (Parameters: {params})"
-            tool_descriptions.append(desc)
+                    buf.write(" (Parameters: ")
+                    buf.write(", ".join(properties))
+                    buf.write(")")
+        if not self.available_tools:
+            buf.write("No tools available")
+        buf.write("""
 
-        tools_text = "\n".join(tool_descriptions) if tool_descriptions else "No tools available"
+When you need to use a tool, respond with a function call. The user will execute the tool and provide you with the results.
+Be helpful, accurate, and use the appropriate tools when needed to provide comprehensive answers.""")
 
+        self._system_content = buf.getvalue()
         return {
             "role": "system",
-            "content": f"""You are an AI assistant with access to MCP (Model Context Protocol) tools. 
-You can use these tools to help answer q`uestions and perform tasks.
-
-Available tools:
-{tools_text}
-
-When you need to use a tool, respond with a function call. The user will execute the tool and provide you with the results.
-Be helpful, accurate, and use the appropriate tools when needed to provide comprehensive answers."""
+            "content": self._system_content
         }
 
+    def _history(self) -> List[Dict]:
+        """Messages to send to the LLM: the system message plus the recent turns"""
+        messages = [self._system_msg] if self._system_msg is not None else []
+        for turn in self._recent:
+            messages.extend(turn)
+        return messages
+
     def convert_tools_for_openai(self) -> List[Dict]:
         """Convert MCP tools to OpenAI function format"""
         openai_tools = []
@@ -478,63 +592,91 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
 
         return openai_tools
 
-    async def process_message(self, user_input: str) -> str:
-        """Process a user message and return response"""
-        # Add user message to history
-        self.conversation_history.append({"role": "user", "content": user_input})
+    async def process_message(self, user_input: str) -> Tuple[str, List[str]]:
+        """Process a user message and return the response with the tools used for it"""
+        # Start a new turn with the user message
+        turn = [{"role": "user", "content": user_input}]
+        self._recent.append(turn)
 
-        # Prepare tools for LM Studio
-        openai_tools = self.convert_tools_for_openai()
+        # Tools for LM Studio, converted at startup
+        openai_tools = self._openai_tools
 
         # Get response from LM Studio
         response = await self.lm_studio.chat_completion(
-            messages=self.conversation_history,
+            messages=self._history(),
             tools=openai_tools if openai_tools else None
         )
 
+        tools_used_this_turn = []
         if "error" in response:
-            return f"Error: {response['error']}"
+            # Drop the unanswered turn so user and assistant messages keep alternating
+            self._recent.pop()
+            return f"Error: {response['error']}", tools_used_this_turn
 
         assistant_message = response["choices"][0]["message"]
-        tools_used_this_turn = []
 
         # Check if the assistant wants to use a tool
         if assistant_message.get("tool_calls"):
             # Process tool calls
-            tool_results = []
+            # Parse every call's arguments before starting any of them; a call whose
+            # arguments don't parse gets an error result instead of running
+            function_names = []
+            results = []
+            calls = []
             for tool_call in assistant_message["tool_calls"]:
                 function_name = tool_call["function"]["name"]
-                arguments = json.loads(tool_call["function"]["arguments"])
+                function_names.append(function_name)
+                try:
+                    arguments = _LOADS(tool_call["function"]["arguments"])
+                except ValueError as e:
+                    results.append(ValueError(f"Invalid tool arguments: {e}"))
+                    continue
 
                 logger.info(f"Calling tool: {function_name} with args: {arguments}")
                 tools_used_this_turn.append(function_name)
+                results.append(None)
+                calls.append((len(results) - 1, function_name, arguments))
+
+            # Independent tool calls run concurrently
+            if len(calls) == 1:
+                index, function_name, arguments = calls[0]
+                results[index] = await self.mcp_client.call_tool(function_name, arguments)
+            elif calls:
+                outcomes = await asyncio.gather(
+                    *(self.mcp_client.call_tool(function_name, arguments) for _, function_name, arguments in calls),
+                    return_exceptions=True
+                )
+                for (index, _, _), outcome in zip(calls, outcomes):
+                    results[index] = outcome
 
-                result = await self.mcp_client.call_tool(function_name, arguments)
-                tool_results.append(f"Tool {function_name} result: {json.dumps(result, indent=2)}")
+            tool_results = []
+            for function_name, result in zip(function_names, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to call tool {function_name}: {result}")
+                    result = {"error": str(result)}
+                tool_results.append(f"Tool {function_name} result: {_DUMPS(result).decode()}")
 
             # Add tool results to conversation and get final response
-            self.conversation_history.append(assistant_message)
-            self.conversation_history.append({
+            turn.append(assistant_message)
+            turn.append({
                 "role": "user",
                 "content": f"Tool results:\n" + "\n".join(tool_results)
             })
 
             # Get final response
-            final_response = await self.lm_studio.chat_completion(messages=self.conversation_history)
+            final_response = await self.lm_studio.chat_completion(messages=self._history())
             if "error" in final_response:
-                return f"Error in final response: {final_response['error']}"
+                self._recent.pop()
+                return f"Error in final response: {final_response['error']}", tools_used_this_turn
 
             final_message = final_response["choices"][0]["message"]
-            self.conversation_history.append(final_message)
-
-            # Track tools used
-            self.tools_used_in_conversation.extend(tools_used_this_turn)
+            turn.append(final_message)
 
-            return final_message["content"]
+            return final_message["content"], tools_used_this_turn
         else:
             # No tools needed, return the response
-            self.conversation_history.append(assistant_message)
-            return assistant_message["content"]
+            turn.append(assistant_message)
+            return assistant_message["content"], tools_used_this_turn
 
     async def run_interactive(self):
         """Run interactive chat loop"""
@@ -542,7 +684,7 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
         print()
         print(self.formatter.format_status_message("Chatbot started successfully!", "success"))
         print(self.formatter.format_status_message(f"Connected to LM Studio at {self.lm_studio.base_url}", "connected"))
-        print(self.formatter.format_status_message(f"Available tools: {', '.join([tool['name'] for tool in self.available_tools]) if self.available_tools else 'None'}", "info"))
+        print(self.formatter.format_status_message(f"Available tools: {self._tool_names_joined}", "info"))
         print()
         print(self.formatter.colorize("Type 'quit', 'exit', or 'bye' to end the conversation", Colors.DIM))
         print(self.formatter.format_separator())
@@ -571,7 +713,7 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
                     print(self.formatter.format_status_message("Processing...", "loading"))
 
                     # Process the message
-                    response = await self.process_message(user_input)
+                    response, _ = await self.process_message(user_input)
 
                     # Clear the processing line and show response
                     print(f"\r{assistant_prompt}", end="")
@@ -597,17 +739,82 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
         finally:
             await self.stop()
 
-    async def run_stdio(self):
-        """Run in stdio/stdin mode for integration with other systems"""
-        logger.info("Running in stdio mode")
-        logger.info(f"Available tools at startup: {[tool['name'] for tool in self.available_tools]}")
+    @staticmethod
+    def _write_stdout(payload: bytes):
+        """Write an encoded JSON document to stdout as a single line-terminated block"""
+        sys.stdout.buffer.write(payload)
+        sys.stdout.buffer.write(b'\n')
+        sys.stdout.buffer.flush()
+
+    async def _read_stdin_lines(self):
+        """Yield lines from stdin without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        fd = sys.stdin.fileno()
+        # Only pipes and sockets are watched by the event loop. Regular files and devices like
+        # /dev/null can't be, and terminals share their file description with stdout/stderr,
+        # which must not be switched to non-blocking mode, so those are read in a thread
+        mode = os.fstat(fd).st_mode
+        if not (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)):
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:  # EOF
+                    return
+                yield line
 
+        reader = asyncio.StreamReader(limit=STDIN_LINE_LIMIT)
+        transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
         try:
             while True:
-                line = sys.stdin.readline()
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as e:
+                    line = e.partial  # last line without a newline, or b'' at EOF
+                except asyncio.LimitOverrunError as e:
+                    # Over-long line: report it, drop the rest of it and carry on with the next one
+                    self._write_error(e)
+                    logger.error(f"Error reading stdio message: {e}")
+                    await self._skip_line(reader, e.consumed)
+                    continue
                 if not line:  # EOF
-                    break
+                    return
+                yield line.decode()
+        finally:
+            # At EOF the transport has already closed stdin; otherwise undo its O_NONBLOCK
+            if not transport.is_closing():
+                os.set_blocking(fd, True)
+
+    @staticmethod
+    async def _skip_line(reader: asyncio.StreamReader, consumed: int):
+        """Discard the remainder of a line that overran the reader limit"""
+        while True:
+            await reader.readexactly(consumed)
+            try:
+                await reader.readuntil(b'\n')
+                return
+            except asyncio.IncompleteReadError:
+                return
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    def _write_error(self, error: Exception):
+        """Write an error response for a stdio message"""
+        error_response = {
+            "error": str(error),
+            "timestamp": datetime.now().isoformat(),
+            "metadata": {
+                "tools_available": self._tool_names,
+                "error_type": type(error).__name__
+            }
+        }
+        self._write_stdout(_DUMPS_INDENT(error_response))
+
+    async def run_stdio(self):
+        """Run in stdio/stdin mode for integration with other systems"""
+        logger.info("Running in stdio mode")
+        logger.info(f"Available tools at startup: {self._tool_names}")
 
+        try:
+            async for line in self._read_stdin_lines():
                 user_input = line.strip()
                 if not user_input:
                     continue
@@ -615,34 +822,19 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
                 logger.info(f"Processing user input: {user_input}")
 
                 try:
-                    response = await self.process_message(user_input)
-
-                    # Get tools used in the last turn
-                    current_tools = list(set(self.tools_used_in_conversation))
-                    tools_in_last_turn = [tool for tool in current_tools if tool not in getattr(self, '_previous_tools', [])]
+                    response, tools_used = await self.process_message(user_input)
 
                     # Format enhanced response for stdio
                     result = self.formatter.format_stdio_response(
                         response=response,
-                        tools_used=tools_in_last_turn,
-                        available_tools=[tool['name'] for tool in self.available_tools]
+                        tools_used=tools_used,
+                        available_tools=self._tool_names
                     )
 
-                    print(json.dumps(result, indent=2, ensure_ascii=False), flush=True)
-
-                    # Update previous tools for next comparison
-                    self._previous_tools = current_tools.copy()
+                    self._write_stdout(_DUMPS_INDENT(result))
 
                 except Exception as e:
-                    error_response = {
-                        "error": str(e),
-                        "timestamp": datetime.now().isoformat(),
-                        "metadata": {
-                            "tools_available": [tool['name'] for tool in self.available_tools],
-                            "error_type": type(e).__name__
-                        }
-                    }
-                    print(json.dumps(error_response, indent=2), flush=True)
+                    self._write_error(e)
                     logger.error(f"Error processing stdio message: {e}", exc_info=True)
 
         except Exception as e:
@@ -653,19 +845,32 @@ Be helpful, accurate, and use the appropriate tools when needed to provide compr
     async def stop(self):
         """Stop the chatbot"""
         logger.info("Stopping MCP Chatbot...")
+        await self.lm_studio.close()
         await self.mcp_client.stop()
         logger.info("MCP Chatbot stopped")
 
+def history_window_arg(value: str) -> int:
+    """argparse type for --history-window that keeps at least the current turn"""
+    window = int(value)
+    if window < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+    return window
+
 async def main():
     parser = argparse.ArgumentParser(description="MCP Chatbot with LM Studio Integration")
     parser.add_argument("--mcp-command", required=True,
                         help="Command to start MCP server (e.g., 'java -jar myapp.jar')")
     parser.add_argument("--lm-studio-url", default="http://localhost:1234",
                         help="LM Studio API URL (default: http://localhost:1234)")
+    parser.add_argument("--lm-timeout", type=float, default=300.0,
+                        help="Total seconds allowed for one LM Studio completion (default: 300)")
     parser.add_argument("--mode", choices=["interactive", "stdio"], default="interactive",
                         help="Run mode: interactive (console) or stdio (for integration)")
     parser.add_argument("--no-colors", action="store_true",
                         help="Disable colored output (useful for terminals without color support)")
+    parser.add_argument("--history-window", type=history_window_arg, default=20,
+                        help="Number of recent conversation turns (a user message and everything it "
+                             "produced) kept in the context (default: 20)")
 
     args = parser.parse_args()
 
@@ -673,7 +878,8 @@ async def main():
     import shlex
     mcp_command = shlex.split(args.mcp_command)
 
-    chatbot = MCPChatBot(mcp_command, args.lm_studio_url, use_colors=not args.no_colors)
+    chatbot = MCPChatBot(mcp_command, args.lm_studio_url, use_colors=not args.no_colors,
+                         history_window=args.history_window, lm_timeout=args.lm_timeout)
 
     try:
         await chatbot.start()